@@ -0,0 +1,71 @@
+"""Measure time from process launch to the first healthy /health response.
+
+Usage:
+    python benchmarks/cold_start.py [--runs 5] [--port 8765] [--preload]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def time_to_healthy(port: int, preload: bool, timeout: float = 60.0) -> dict:
+    """Start the API server once and time how long /health takes to answer"""
+    command = [sys.executable, "main.py", "--host", "127.0.0.1", "--port", str(port)]
+    if preload:
+        command.append("--preload")
+
+    # main.py copies REPLICATE_API_KEY into the environment at import time
+    env = {"REPLICATE_API_KEY": "benchmark", **os.environ}
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                response = requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+                if response.status_code == 200:
+                    healthy = time.perf_counter() - started
+                    report = requests.get(f"http://127.0.0.1:{port}/startup-report", timeout=1).json()
+                    return {"healthy_seconds": healthy, **report}
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"Server did not become healthy within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--preload", action="store_true", help="Benchmark with heavy modules preloaded")
+    args = parser.parse_args()
+
+    results = [time_to_healthy(args.port, args.preload) for _ in range(args.runs)]
+    healthy = [r["healthy_seconds"] for r in results]
+    imports = [r["import_seconds"] for r in results]
+
+    mode = "preload" if args.preload else "lazy"
+    print(f"Mode: {mode} ({args.runs} runs)")
+    print(f"Time to first healthy response: median {statistics.median(healthy):.3f}s, "
+          f"min {min(healthy):.3f}s, max {max(healthy):.3f}s")
+    print(f"Module import time: median {statistics.median(imports):.3f}s")
+    print(f"Heavy modules loaded at startup: {results[-1]['loaded_modules'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""End-to-end pipeline benchmark that replays recorded provider responses.
+
+Provider calls (LLM, BFL image editing, Chatterbox TTS, Kling video) are
+replaced with local fixtures from benchmarks/fixtures/, so every run measures
+only the work this server does: story parsing, asset generation, audio
+assembly, movie rendering and download.
+
+Usage:
+    python benchmarks/pipeline.py                      # full matrix, compare to baseline
+    python benchmarks/pipeline.py --quick              # 3 scenes at 480p
+    python benchmarks/pipeline.py --update-baseline    # store results as the new baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+FIXTURES_DIR = BENCH_DIR / "fixtures"
+GENERATED_DIR = FIXTURES_DIR / "generated"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+
+RESOLUTIONS = {
+    "480p": (854, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+SCENE_COUNTS = [3, 10, 25, 50]
+STAGES = ["story_parse", "asset_generation", "audio_assembly", "render", "download"]
+
+# Metrics gated against the baseline, with the floor below which they are too noisy to compare
+GATED_METRICS = {
+    "seconds": 0.05,
+    "cpu_seconds": 0.05,
+    "rss_growth_mb": 5.0,
+}
+
+
+def make_fixtures(resolution: str) -> dict:
+    """Return fixture paths for a resolution, synthesizing any that were not recorded"""
+    from PIL import Image, ImageDraw
+    from moviepy.editor import ColorClip
+    import wave
+    import math
+    import struct
+
+    width, height = RESOLUTIONS[resolution]
+    GENERATED_DIR.mkdir(parents=True, exist_ok=True)
+    fixtures = {
+        "image": FIXTURES_DIR / f"image_{resolution}.jpeg",
+        "audio": FIXTURES_DIR / "narration.wav",
+        "video": FIXTURES_DIR / f"scene_{resolution}.mp4",
+    }
+
+    for name, path in fixtures.items():
+        if path.exists():
+            continue
+        path = fixtures[name] = GENERATED_DIR / path.name
+        if path.exists():
+            continue
+
+        if name == "image":
+            image = Image.new("RGB", (width, height), (40, 60, 90))
+            draw = ImageDraw.Draw(image)
+            for i in range(0, width, 40):
+                draw.line([(i, 0), (width - i, height)], fill=(200, 170, 60), width=3)
+            image.save(path, quality=90)
+        elif name == "audio":
+            framerate = 24000
+            with wave.open(str(path), "wb") as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(framerate)
+                wf.writeframes(b"".join(
+                    struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / framerate)))
+                    for i in range(int(framerate * 1.5))
+                ))
+        else:
+            clip = ColorClip(size=(width, height), color=(90, 60, 40), duration=2)
+            clip.write_videofile(str(path), fps=24, logger=None)
+            clip.close()
+
+    return {name: str(path) for name, path in fixtures.items()}
+
+
+def scaled_story(scene_count: int) -> str:
+    """Recorded story response repeated to the requested number of scenes"""
+    story = json.loads((FIXTURES_DIR / "story.json").read_text())
+    recorded = story["scenes"]
+    story["scenes"] = [
+        {**recorded[i % len(recorded)], "scene_id": i + 1}
+        for i in range(scene_count)
+    ]
+    return json.dumps(story)
+
+
+class ResourceMonitor:
+    """Measures wall time, CPU time, peak RSS and RSS growth of a block of work"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_rss = 0
+        self.running = False
+
+    @staticmethod
+    def current_rss() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            # ru_maxrss is kilobytes on Linux and bytes on macOS
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _sample(self):
+        while self.running:
+            self.peak_rss = max(self.peak_rss, self.current_rss())
+            time.sleep(self.interval)
+
+    @staticmethod
+    def cpu_seconds() -> float:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+    def __enter__(self):
+        self.entry_rss = self.peak_rss = self.current_rss()
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        self.started = time.perf_counter()
+        self.cpu_started = self.cpu_seconds()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        self.cpu = self.cpu_seconds() - self.cpu_started
+        self.running = False
+        self.thread.join()
+        self.peak_rss = max(self.peak_rss, self.current_rss())
+        return False
+
+
+def replay_providers(main, fixtures: dict, story_text: str):
+    """Patch every remote provider call in main with a fixture replay"""
+    from PIL import Image
+
+    description_text = (FIXTURES_DIR / "image_description.json").read_text()
+
+    def llm_call(system_prompt, prompt, llm="openai/gpt-4o", image=None):
+        if system_prompt == main.IMAGE_DESCRIPTION_SYSTEM_PROMPT:
+            return description_text
+        return story_text
+
+    def edit_image(image, prompt, aspect_ratio="16:9"):
+        with Image.open(fixtures["image"]) as recorded:
+            return recorded.copy()
+
+    def copy_fixture(url, filename):
+        shutil.copyfile(url, filename)
+        return filename
+
+    return [
+        mock.patch.object(main, "llm_call", llm_call),
+        mock.patch.object(main, "edit_image", edit_image),
+        mock.patch.object(main, "generate_image", lambda text, aspect_ratio="16:9": edit_image(None, text)),
+        mock.patch.object(main, "generate_audio", lambda text, audio_path=None: fixtures["audio"]),
+        mock.patch.object(main, "save_audio", copy_fixture),
+        mock.patch.object(main, "generate_video_from_images_kling", lambda image_path, prompt: fixtures["video"]),
+        mock.patch.object(main, "save_video", copy_fixture),
+    ]
+
+
+async def run_pipeline(main, scene_count: int, resolution: str, use_video: bool) -> dict:
+    """Run every pipeline stage once and measure each of them"""
+    from fastapi import Request, UploadFile
+    from moviepy.editor import ColorClip
+
+    fixtures = make_fixtures(resolution)
+    request = Request({"type": "http", "headers": [(b"x-client-id", b"benchmark")], "client": ("benchmark", 0)})
+    stages = {}
+
+    for patch in replay_providers(main, fixtures, scaled_story(scene_count)):
+        patch.start()
+    try:
+        with open(fixtures["image"], "rb") as f:
+            upload = UploadFile(file=BytesIO(f.read()), filename="upload.jpeg")
+        session_id = (await main.upload_image(request, upload))["session_id"]
+
+        with ResourceMonitor() as monitor:
+            story = (await main.generate_story(
+                request, session_id=session_id, story_prompt="benchmark", style_prompt="", aspect_ratio="16:9"
+            ))["story"]
+            main.Story(**story)
+        stages["story_parse"] = monitor
+
+        with ResourceMonitor() as monitor:
+            await main.generate_assets(request, session_id=session_id, audio_path=None)
+            while not main.generation_status.get(session_id, {}).get("completed"):
+                await asyncio.sleep(0.01)
+        stages["asset_generation"] = monitor
+        if main.generation_status[session_id]["error"]:
+            raise RuntimeError(main.generation_status[session_id]["error"])
+
+        audio_paths = [asset["audio_path"] for asset in main.sessions[session_id]["scene_assets"]]
+        # The server's own per-scene audio step; encoding the mixed track happens in render
+        placeholder = ColorClip(size=RESOLUTIONS[resolution], color=(0, 0, 0))
+        with ResourceMonitor() as monitor:
+            audio_clips = main.scene_audio_clips(audio_paths)
+            for audio_clip in audio_clips:
+                main.attach_scene_audio(placeholder, audio_clip)
+        for audio_clip in audio_clips:
+            audio_clip.close()
+        stages["audio_assembly"] = monitor
+
+        with ResourceMonitor() as monitor:
+            movie_path = (await main.generate_movie(
+                main.MovieGenerationRequest(session_id=session_id, use_video_generator=use_video), request
+            ))["movie_path"]
+        stages["render"] = monitor
+
+        with ResourceMonitor() as monitor:
+            response = await main.download_file(session_id, Path(movie_path).name)
+            with open(response.path, "rb") as f:
+                while f.read(response.chunk_size):
+                    pass
+        stages["download"] = monitor
+    finally:
+        mock.patch.stopall()
+
+    return {
+        stage: {
+            "seconds": round(stages[stage].seconds, 4),
+            "cpu_seconds": round(stages[stage].cpu, 4),
+            "peak_rss_mb": round(stages[stage].peak_rss / (1024 * 1024), 1),
+            # Growth within the stage does not depend on which cases ran earlier in the process
+            "rss_growth_mb": round((stages[stage].peak_rss - stages[stage].entry_rss) / (1024 * 1024), 1),
+            "scenes_per_second": round(scene_count / stages[stage].seconds, 2) if stages[stage].seconds else None,
+        }
+        for stage in STAGES
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """List the stage metrics that regressed beyond tolerance"""
+    regressions = []
+    for case, stages in results.items():
+        for stage, metrics in stages.items():
+            expected = baseline.get(case, {}).get(stage)
+            if not expected:
+                continue
+            for metric, floor in GATED_METRICS.items():
+                if metric not in expected or max(expected[metric], metrics[metric]) < floor:
+                    continue
+                if metrics[metric] > expected[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{case} {stage} {metric}: {metrics[metric]:.3f} vs baseline {expected[metric]:.3f}"
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenes", type=int, nargs="+", default=SCENE_COUNTS)
+    parser.add_argument("--resolutions", nargs="+", choices=RESOLUTIONS, default=list(RESOLUTIONS))
+    parser.add_argument("--video", action="store_true", help="Render in video mode instead of slideshow")
+    parser.add_argument("--quick", action="store_true", help="Only run 3 scenes at 480p")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed increase in time, CPU or peak RSS before failing")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", type=Path, help="Also write results as JSON to this path")
+    args = parser.parse_args()
+    if args.quick:
+        args.scenes, args.resolutions = [3], ["480p"]
+    if args.output:
+        # The run happens in a temporary working directory
+        args.output = args.output.resolve()
+
+    # Keep admission control and the storage sweeper out of the measurements
+    os.environ.setdefault("REPLICATE_API_KEY", "benchmark")
+    os.environ["CLIENT_RATE_PER_MINUTE"] = "100000"
+    os.environ["CLIENT_BURST"] = "100000"
+    os.environ["STORAGE_SWEEP_INTERVAL"] = "0"
+
+    work_dir = tempfile.mkdtemp(prefix="movie_gen_bench_")
+    os.chdir(work_dir)
+    sys.path.insert(0, str(REPO_DIR))
+    import main as server
+
+    mode = "video" if args.video else "slideshow"
+    results = {}
+    try:
+        for resolution in args.resolutions:
+            for scene_count in args.scenes:
+                case = f"{mode}-{resolution}-{scene_count}"
+                print(f"Running {case}...")
+                results[case] = asyncio.run(run_pipeline(server, scene_count, resolution, args.video))
+                for stage, metrics in results[case].items():
+                    print(
+                        f"  {stage:<17} {metrics['seconds']:8.3f}s  cpu {metrics['cpu_seconds']:8.3f}s  "
+                        f"rss {metrics['peak_rss_mb']:7.1f}MB (+{metrics['rss_growth_mb']:.1f})  "
+                        f"{metrics['scenes_per_second']} scenes/s"
+                    )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    if args.update_baseline:
+        baseline.update(results)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline updated: {BASELINE_PATH}")
+        return
+
+    if not baseline:
+        print("No baseline stored yet, run with --update-baseline to create one")
+        return
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,38 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+import time
+
+# Captured before any other import so the startup report covers module load
+PROCESS_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, TYPE_CHECKING
 import os
 import requests
 import base64
-from PIL import Image
 from io import BytesIO
 import dotenv
-import time
-import replicate
-from moviepy.editor import ImageClip, AudioFileClip, concatenate_videoclips, VideoFileClip
+import importlib
 import json
-from multiprocessing import Pool, cpu_count
 import shutil
 import uuid
 from pathlib import Path
-from tqdm import tqdm
 import threading
+import math
+from collections import deque
 import wave
 import struct
+import hashlib
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# PIL, replicate and moviepy are imported on first use via load_module()
+if TYPE_CHECKING:
+    from PIL import Image
 
 # Load environment variables
 dotenv.load_dotenv()
@@ -40,6 +52,26 @@ app.add_middleware(
 # Set up environment variables
 os.environ["REPLICATE_API_TOKEN"] = os.getenv("REPLICATE_API_KEY")
 
+# Heavy media and provider modules, loaded on first use or at startup with --preload
+HEAVY_MODULES = ["PIL.Image", "replicate", "moviepy.editor"]
+PRELOAD_MODULES = os.getenv("PRELOAD_MODULES", "").lower() in ("1", "true", "yes")
+module_load_times = {}
+startup_report = {
+    "import_seconds": time.perf_counter() - PROCESS_STARTED,
+    "ready_seconds": None,
+    "preloaded": False,
+}
+
+def load_module(name: str):
+    """Import a module on first use and record how long the import took"""
+    module = sys.modules.get(name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        module_load_times[name] = time.perf_counter() - started
+        print(f"Loaded {name} in {module_load_times[name]:.2f}s")
+    return module
+
 # Create output directories
 OUTPUT_DIR = Path("output")
 OUTPUT_DIR.mkdir(exist_ok=True)
@@ -78,6 +110,41 @@ sessions = {}
 # Store generation status for each session
 generation_status = {}
 
+# Uploaded voice samples keyed by content hash, shared across sessions
+VOICE_SAMPLE_CACHE_PATH = OUTPUT_DIR / "voice_sample_cache.json"
+VOICE_SAMPLE_URL_TTL = 23 * 60 * 60  # Replicate file URLs expire after a day
+VOICE_SAMPLE_MAX_SECONDS = 20
+VOICE_SAMPLE_SILENCE_THRESHOLD = 500
+VOICE_SAMPLE_TARGET_PEAK = 0.9
+voice_sample_cache = {}
+voice_sample_lock = threading.Lock()
+voice_sample_digest_locks = {}
+VOICE_SAMPLE_UPLOAD_TIMEOUT = 30
+
+# Maximum number of concurrent TTS calls per asset generation run
+TTS_MAX_CONCURRENCY = 4
+
+# Admission control limits for the expensive generation endpoints
+MAX_ACTIVE_GENERATIONS = int(os.getenv("MAX_ACTIVE_GENERATIONS", "2"))
+MAX_QUEUED_GENERATIONS = int(os.getenv("MAX_QUEUED_GENERATIONS", "8"))
+CLIENT_RATE_PER_MINUTE = float(os.getenv("CLIENT_RATE_PER_MINUTE", "6"))
+CLIENT_BURST = float(os.getenv("CLIENT_BURST", "5"))
+CLIENT_BUCKET_LIMIT = 10000
+# Proxies whose X-Forwarded-For is trusted, and whether X-Client-ID may key quotas
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+TRUST_CLIENT_ID_HEADER = os.getenv("TRUST_CLIENT_ID_HEADER", "").lower() in ("1", "true", "yes")
+BFL_RATE_PER_MINUTE = float(os.getenv("BFL_RATE_PER_MINUTE", "60"))
+REPLICATE_RATE_PER_MINUTE = float(os.getenv("REPLICATE_RATE_PER_MINUTE", "120"))
+
+# Storage lifecycle for output/{session_id} directories
+FINAL_MOVIE_FILES = {"final_slideshow_movie.mp4", "final_video_movie.mp4"}
+STORAGE_RETENTION_DAYS = float(os.getenv("STORAGE_RETENTION_DAYS", "7"))
+STORAGE_INTERMEDIATE_GRACE_HOURS = float(os.getenv("STORAGE_INTERMEDIATE_GRACE_HOURS", "1"))
+STORAGE_DELETE_INTERMEDIATES = os.getenv("STORAGE_DELETE_INTERMEDIATES", "true").lower() in ("1", "true", "yes")
+STORAGE_SWEEP_INTERVAL = int(os.getenv("STORAGE_SWEEP_INTERVAL", "3600"))
+storage_digests = {}
+last_storage_sweep = {}
+
 # System prompts
 STORY_SYSTEM_PROMPT = """
 You are a masterful children's and adult fiction storyteller. Your job is to create immersive, emotionally rich, and hyper-realistic stories based on a user's input image and/or description of a character.
@@ -127,7 +194,23 @@ Keep the description factual and descriptive, avoiding interpretation or storyte
 """
 
 # Utility functions
-def image_to_data_uri(image: Image.Image) -> str:
+@contextmanager
+def replace_atomically(path):
+    """Yield a temporary path that replaces path once fully written
+
+    Files under output/ may be hard-linked across sessions by the storage
+    sweeper, so they are always replaced rather than rewritten in place.
+    """
+    root, ext = os.path.splitext(str(path))
+    temp_path = f"{root}.{uuid.uuid4().hex}.tmp{ext}"
+    try:
+        yield temp_path
+        os.replace(temp_path, str(path))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def image_to_data_uri(image: "Image.Image") -> str:
     """Convert PIL Image to data URI"""
     buffered = BytesIO()
     image.save(buffered, format="JPEG")
@@ -136,7 +219,7 @@ def image_to_data_uri(image: Image.Image) -> str:
 
 def image_to_uri(path: str) -> str:
     """Convert image file to URI"""
-    img = Image.open(path)
+    img = load_module("PIL.Image").open(path)
     buffered = BytesIO()
     img.save(buffered, format="JPEG")
     return f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode()}"
@@ -158,20 +241,22 @@ def llm_call(system_prompt: str, prompt: str, llm: str = "openai/gpt-4o", image=
             }
         
         output_text = ""
-        for event in replicate.stream(llm, input=input_data):
+        provider_buckets["replicate"].acquire()
+        for event in load_module("replicate").stream(llm, input=input_data):
             output_text += str(event)
         
         return output_text
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM call failed: {str(e)}")
 
-def edit_image(image: Image.Image, prompt: str, aspect_ratio: str = "16:9") -> Image.Image:
+def edit_image(image: "Image.Image", prompt: str, aspect_ratio: str = "16:9") -> "Image.Image":
     """Edit image using Flux API"""
     try:
         buffered = BytesIO()
         image.save(buffered, format="JPEG")
         image_str = base64.b64encode(buffered.getvalue()).decode()
 
+        provider_buckets["bfl"].acquire()
         request = requests.post(
             'https://api.bfl.ai/v1/flux-kontext-pro',
             headers={
@@ -210,7 +295,7 @@ def edit_image(image: Image.Image, prompt: str, aspect_ratio: str = "16:9") -> I
 
         image_url = result['result']['sample']
         response = requests.get(image_url)
-        return Image.open(BytesIO(response.content))
+        return load_module("PIL.Image").open(BytesIO(response.content))
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image editing failed: {str(e)}")
@@ -218,6 +303,7 @@ def edit_image(image: Image.Image, prompt: str, aspect_ratio: str = "16:9") -> I
 def generate_image(text: str, aspect_ratio: str = "16:9") -> str:
     """Generate image from text using Flux API"""
     try:
+        provider_buckets["bfl"].acquire()
         request = requests.post(
             'https://api.bfl.ai/v1/flux-kontext-pro',
             headers={
@@ -250,7 +336,7 @@ def generate_image(text: str, aspect_ratio: str = "16:9") -> str:
             if status == 'Ready':
                 image_url = result['result']['sample']
                 response = requests.get(image_url)
-                return Image.open(BytesIO(response.content))
+                return load_module("PIL.Image").open(BytesIO(response.content))
             elif status in ['Error', 'Failed']:
                 raise HTTPException(status_code=500, detail=f"Image generation failed: {result}")
     
@@ -258,9 +344,10 @@ def generate_image(text: str, aspect_ratio: str = "16:9") -> str:
         raise HTTPException(status_code=500, detail=f"Image generation failed: {str(e)}")
 
 def generate_audio(text: str, audio_path: str=None) -> str:
-    """Generate audio from text"""
+    """Generate audio from text, cloning the voice at the audio_path URL if given"""
     try:
-        output = replicate.run(
+        provider_buckets["replicate"].acquire()
+        output = load_module("replicate").run(
             "resemble-ai/chatterbox",
             input={
                 "seed": 0,
@@ -279,12 +366,158 @@ def save_audio(audio_url: str, filename: str) -> str:
     """Save audio from URL to file"""
     try:
         response = requests.get(audio_url)
-        with open(filename, "wb") as f:
+        with replace_atomically(filename) as temp_path, open(temp_path, "wb") as f:
             f.write(response.content)
         return filename
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Audio saving failed: {str(e)}")
 
+def write_silent_audio(filename: str, seconds: int = 1) -> str:
+    """Write a silent placeholder WAV file"""
+    with replace_atomically(filename) as temp_path, wave.open(temp_path, 'w') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(struct.pack('<h', 0) * 16000 * seconds)
+    return filename
+
+def generate_scene_audio(text: str, voice_sample_url: Optional[str], filename: str) -> str:
+    """Generate and save narration for a scene, falling back to silence on failure"""
+    try:
+        audio_url = generate_audio(text, voice_sample_url)
+        save_audio(audio_url, filename)
+        print(f"Audio saved: {filename}")
+    except Exception as audio_err:
+        print(f"Audio generation failed for {filename}: {audio_err}. Creating silent placeholder.")
+        write_silent_audio(filename)
+    return filename
+
+def prepare_voice_sample(audio_path: str) -> str:
+    """Trim silence from and peak-normalize a recorded voice sample"""
+    try:
+        with wave.open(audio_path, 'rb') as wf:
+            params = wf.getparams()
+            frames = wf.readframes(params.nframes)
+    except (wave.Error, EOFError) as e:
+        # Browsers often record webm/ogg; send those through untouched
+        print(f"Voice sample is not a PCM WAV ({e}), using it as recorded")
+        return audio_path
+
+    if params.sampwidth != 2 or not frames:
+        return audio_path
+
+    samples = array('h', frames)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+
+    channels = params.nchannels
+    loud = [i for i, sample in enumerate(samples) if abs(sample) >= VOICE_SAMPLE_SILENCE_THRESHOLD]
+    if not loud:
+        return audio_path
+
+    # Keep a short pad around the voiced region and cap the clip length
+    pad = params.framerate // 10
+    start = max(loud[0] // channels - pad, 0)
+    end = min(loud[-1] // channels + pad + 1, len(samples) // channels)
+    end = min(end, start + VOICE_SAMPLE_MAX_SECONDS * params.framerate)
+    trimmed = samples[start * channels:end * channels]
+
+    peak = max(abs(sample) for sample in trimmed)
+    gain = VOICE_SAMPLE_TARGET_PEAK * 32767 / peak
+    normalized = array('h', (max(-32768, min(32767, int(sample * gain))) for sample in trimmed))
+    if sys.byteorder == 'big':
+        normalized.byteswap()
+
+    prepared_path = Path(audio_path).with_name("recorded_voice_prepared.wav")
+    with replace_atomically(prepared_path) as temp_path, wave.open(temp_path, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(params.framerate)
+        wf.writeframes(normalized.tobytes())
+    return str(prepared_path)
+
+def load_voice_sample_cache():
+    """Load persisted voice sample URLs from disk"""
+    if VOICE_SAMPLE_CACHE_PATH.exists():
+        try:
+            voice_sample_cache.update(json.loads(VOICE_SAMPLE_CACHE_PATH.read_text()))
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable voice sample cache: {e}")
+
+load_voice_sample_cache()
+
+def audio_content_type(content: bytes) -> str:
+    """Guess the MIME type of a recorded audio file from its header"""
+    if content[:4] == b"RIFF":
+        return "audio/wav"
+    if content[:4] == b"OggS":
+        return "audio/ogg"
+    if content[:4] == b"\x1a\x45\xdf\xa3":
+        return "audio/webm"
+    return "application/octet-stream"
+
+def cached_voice_sample_url(digest: str) -> Optional[str]:
+    """Return an unexpired uploaded URL for a voice sample digest"""
+    with voice_sample_lock:
+        cached = voice_sample_cache.get(digest)
+    if cached and time.time() - cached["uploaded_at"] < VOICE_SAMPLE_URL_TTL:
+        return cached["url"]
+    return None
+
+def upload_voice_sample(audio_path: str) -> str:
+    """Upload a voice sample once per content hash and return its URL"""
+    with open(audio_path, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    content_type = audio_content_type(content)
+
+    url = cached_voice_sample_url(digest)
+    if url:
+        return url
+
+    # Only uploads of the same sample wait for each other
+    with voice_sample_lock:
+        digest_lock = voice_sample_digest_locks.setdefault(digest, threading.Lock())
+
+    with digest_lock:
+        url = cached_voice_sample_url(digest)
+        if url:
+            return url
+
+        try:
+            response = requests.post(
+                'https://api.replicate.com/v1/files',
+                headers={'Authorization': f"Bearer {os.environ.get('REPLICATE_API_TOKEN')}"},
+                files={'content': (Path(audio_path).name, content, content_type)},
+                timeout=VOICE_SAMPLE_UPLOAD_TIMEOUT,
+            )
+            response.raise_for_status()
+            url = response.json()["urls"]["get"]
+        except Exception as e:
+            # Not cached, so the next story retries the upload
+            print(f"Voice sample upload failed ({e}), sending it inline instead")
+            return f"data:{content_type};base64,{base64.b64encode(content).decode()}"
+
+        with voice_sample_lock:
+            voice_sample_cache[digest] = {"url": url, "uploaded_at": time.time()}
+            VOICE_SAMPLE_CACHE_PATH.write_text(json.dumps(voice_sample_cache))
+        return url
+
+def get_voice_sample_url(session_id: str) -> Optional[str]:
+    """Return the uploaded voice sample URL for a session, preparing it on first use"""
+    session_data = sessions[session_id]
+    if "voice_sample_url" in session_data:
+        return session_data["voice_sample_url"]
+
+    recorded_audio_path = session_data.get("recorded_audio_path")
+    if not recorded_audio_path:
+        return None
+
+    voice_sample_url = upload_voice_sample(prepare_voice_sample(recorded_audio_path))
+    if not voice_sample_url.startswith("data:"):
+        session_data["voice_sample_url"] = voice_sample_url
+    return voice_sample_url
+
 def generate_video_from_images_kling(image_path: str, prompt: str) -> str:
     """Generate video using Kling model"""
     try:
@@ -296,7 +529,8 @@ def generate_video_from_images_kling(image_path: str, prompt: str) -> str:
             "negative_prompt": ""
         }
         
-        output = replicate.run("kwaivgi/kling-v2.1", input=input_params)
+        provider_buckets["replicate"].acquire()
+        output = load_module("replicate").run("kwaivgi/kling-v2.1", input=input_params)
         return output
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Video generation failed: {str(e)}")
@@ -305,26 +539,366 @@ def save_video(video_url: str, filename: str) -> str:
     """Save video from URL to file"""
     try:
         response = requests.get(video_url)
-        with open(filename, "wb") as f:
+        with replace_atomically(filename) as temp_path, open(temp_path, "wb") as f:
             f.write(response.content)
         return filename
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Video saving failed: {str(e)}")
 
 # Simple status tracking
-def set_generation_status(session_id: str, status: str, completed: bool = False, error: str = None):
+def set_generation_status(session_id: str, status: str, completed: bool = False, error: str = None,
+                          queue_position: int = None):
     """Set generation status for a session"""
     generation_status[session_id] = {
         "status": status,
         "completed": completed,
-        "error": error
+        "error": error,
+        "queue_position": queue_position
+    }
+
+# Admission control
+class TokenBucket:
+    """Token bucket rate limiter refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        if rate_per_minute <= 0:
+            raise ValueError(f"Rate must be positive, got {rate_per_minute} per minute")
+        self.rate = rate_per_minute / 60.0
+        # A bucket that cannot hold a whole token would never grant one
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token, returning 0 on success or the seconds until one is available"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        """Return a token taken for work that was not done"""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def is_idle(self) -> bool:
+        """Whether the bucket has refilled completely"""
+        with self.lock:
+            self._refill()
+            return self.tokens >= self.capacity
+
+class GenerationGate:
+    """Caps concurrent generations and holds a bounded FIFO queue of waiting ones"""
+
+    def __init__(self, max_active: int, max_queued: int, expected_seconds: float = 60.0):
+        if max_active < 1 or max_queued < 0:
+            raise ValueError(f"Invalid generation limits: {max_active} active, {max_queued} queued")
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.average_seconds = expected_seconds
+        self.active = set()
+        self.owners = {}
+        self.waiting = deque()
+        self.condition = threading.Condition()
+
+    def admit(self, owner: str = None) -> str:
+        """Reserve a slot or a queue place, raising 429 when the queue is full"""
+        ticket = str(uuid.uuid4())
+        with self.condition:
+            if owner:
+                self.owners[ticket] = owner
+            if len(self.active) < self.max_active and not self.waiting:
+                self.active.add(ticket)
+            elif len(self.waiting) < self.max_queued:
+                self.waiting.append(ticket)
+            else:
+                self.owners.pop(ticket, None)
+                raise HTTPException(
+                    status_code=429,
+                    detail="Server is busy with other generations, please retry later",
+                    headers={"Retry-After": str(self._retry_after())}
+                )
+        return ticket
+
+    def position(self, ticket: str) -> int:
+        """Queue position of a ticket, 0 once it is active"""
+        with self.condition:
+            return 0 if ticket in self.active else self.waiting.index(ticket) + 1
+
+    def run(self, ticket: str, work, on_position=None):
+        """Wait for the ticket's turn, run work and release the slot afterwards"""
+        try:
+            with self.condition:
+                last_position = None
+                while ticket not in self.active:
+                    position = self.waiting.index(ticket) + 1
+                    if on_position and position != last_position:
+                        on_position(position)
+                    last_position = position
+                    self.condition.wait()
+            started = time.monotonic()
+            try:
+                return work()
+            finally:
+                # Smooth the expected duration used for Retry-After estimates
+                self.average_seconds = 0.8 * self.average_seconds + 0.2 * (time.monotonic() - started)
+        finally:
+            self.release(ticket)
+
+    def release(self, ticket: str):
+        """Free a slot or queue place and promote waiting tickets"""
+        with self.condition:
+            self.active.discard(ticket)
+            self.owners.pop(ticket, None)
+            if ticket in self.waiting:
+                self.waiting.remove(ticket)
+            while self.waiting and len(self.active) < self.max_active:
+                self.active.add(self.waiting.popleft())
+            self.condition.notify_all()
+
+    def is_owner_busy(self, owner: str) -> bool:
+        """Whether a session holds an active or queued ticket"""
+        with self.condition:
+            return owner in self.owners.values()
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.average_seconds * (len(self.waiting) + 1) / self.max_active))
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                "active": len(self.active),
+                "queued": len(self.waiting),
+                "max_active": self.max_active,
+                "max_queued": self.max_queued,
+                "average_seconds": round(self.average_seconds, 1)
+            }
+
+generation_gate = GenerationGate(MAX_ACTIVE_GENERATIONS, MAX_QUEUED_GENERATIONS)
+provider_buckets = {
+    "bfl": TokenBucket(BFL_RATE_PER_MINUTE, BFL_RATE_PER_MINUTE / 6),
+    "replicate": TokenBucket(REPLICATE_RATE_PER_MINUTE, REPLICATE_RATE_PER_MINUTE / 6),
+}
+client_buckets = {}
+client_buckets_lock = threading.Lock()
+
+def get_client_id(request: Request) -> str:
+    """Identify the caller by peer address, or the forwarded address behind a trusted proxy"""
+    if TRUST_CLIENT_ID_HEADER and request.headers.get("X-Client-ID"):
+        return request.headers["X-Client-ID"]
+
+    client_host = request.client.host if request.client else "unknown"
+    if client_host in TRUSTED_PROXIES:
+        # Walk back from the nearest hop, skipping our own proxies
+        forwarded = [hop.strip() for hop in request.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+        for hop in reversed(forwarded):
+            if hop not in TRUSTED_PROXIES:
+                return hop
+    return client_host
+
+def check_client_rate(request: Request) -> TokenBucket:
+    """Apply the per-client token bucket, raising 429 when it is empty"""
+    client_id = get_client_id(request)
+    with client_buckets_lock:
+        if len(client_buckets) > CLIENT_BUCKET_LIMIT:
+            for idle_id in [cid for cid, bucket in client_buckets.items() if bucket.is_idle()]:
+                del client_buckets[idle_id]
+        bucket = client_buckets.setdefault(
+            client_id, TokenBucket(CLIENT_RATE_PER_MINUTE, CLIENT_BURST)
+        )
+
+    wait = bucket.try_acquire()
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded for this client",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+    return bucket
+
+def admit_generation(request: Request, session_id: str = None) -> str:
+    """Rate-limit the client and reserve a generation slot or queue place"""
+    bucket = check_client_rate(request)
+    try:
+        return generation_gate.admit(owner=session_id)
+    except HTTPException:
+        # The client should not lose quota when the server is the one that is full
+        bucket.refund()
+        raise
+
+# Storage lifecycle
+def file_digest(path: Path, stat: os.stat_result) -> str:
+    """SHA-256 of a file, cached by path, size and modification time"""
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if key not in storage_digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        storage_digests[key] = digest.hexdigest()
+    return storage_digests[key]
+
+def session_disk_usage(session_dir: Path, seen_inodes: set = None) -> dict:
+    """Disk usage of a session directory, counting hard-linked files once"""
+    seen_inodes = set() if seen_inodes is None else seen_inodes
+    usage = {
+        "files": 0,
+        "bytes": 0,
+        "final_bytes": 0,
+        "intermediate_bytes": 0,
+        "last_modified": session_dir.stat().st_mtime,
     }
+    for path in session_dir.iterdir():
+        if not path.is_file():
+            continue
+        stat = path.stat()
+        usage["files"] += 1
+        usage["last_modified"] = max(usage["last_modified"], stat.st_mtime)
+        if (stat.st_dev, stat.st_ino) in seen_inodes:
+            continue
+        seen_inodes.add((stat.st_dev, stat.st_ino))
+        usage["bytes"] += stat.st_size
+        usage["final_bytes" if path.name in FINAL_MOVIE_FILES else "intermediate_bytes"] += stat.st_size
+    return usage
+
+def is_session_busy(session_id: str) -> bool:
+    """Whether a session has a generation running or queued"""
+    return (
+        generation_gate.is_owner_busy(session_id)
+        or generation_status.get(session_id, {}).get("completed") is False
+    )
+
+def retire_session(session_id: str) -> bool:
+    """Forget a session's in-memory state unless a generation is using it
+
+    Holding the gate's lock means no ticket can be admitted between the
+    busy check and the removal; later generations find no session.
+    """
+    with generation_gate.condition:
+        if is_session_busy(session_id):
+            return False
+        sessions.pop(session_id, None)
+        generation_status.pop(session_id, None)
+        return True
+
+def remove_session(session_dir: Path) -> int:
+    """Delete a session directory"""
+    freed = sum(p.stat().st_size for p in session_dir.iterdir() if p.is_file() and p.stat().st_nlink == 1)
+    shutil.rmtree(session_dir, ignore_errors=True)
+    return freed
+
+def remove_intermediates(session_dir: Path) -> tuple:
+    """Delete everything but the final movies from a session directory"""
+    removed, freed = 0, 0
+    for path in session_dir.iterdir():
+        if path.is_file() and path.name not in FINAL_MOVIE_FILES:
+            stat = path.stat()
+            path.unlink()
+            removed += 1
+            freed += stat.st_size if stat.st_nlink == 1 else 0
+    return removed, freed
+
+def sweep_storage() -> dict:
+    """Apply the retention policy to output/ and hard-link duplicate assets"""
+    started = time.time()
+    result = {
+        "removed_sessions": 0,
+        "removed_intermediates": 0,
+        "deduplicated_files": 0,
+        "freed_bytes": 0,
+    }
+    retention_cutoff = started - STORAGE_RETENTION_DAYS * 24 * 60 * 60
+    settled_cutoff = started - STORAGE_INTERMEDIATE_GRACE_HOURS * 60 * 60
+    canonical = {}
+
+    for session_dir in sorted(p for p in OUTPUT_DIR.iterdir() if p.is_dir()):
+        session_id = session_dir.name
+        usage = session_disk_usage(session_dir)
+        if usage["last_modified"] < retention_cutoff:
+            if retire_session(session_id):
+                result["freed_bytes"] += remove_session(session_dir)
+                result["removed_sessions"] += 1
+            continue
+
+        # Only touch sessions nobody has written to recently
+        if usage["last_modified"] >= settled_cutoff:
+            continue
+
+        has_final = any((session_dir / name).exists() for name in FINAL_MOVIE_FILES)
+        if has_final and STORAGE_DELETE_INTERMEDIATES and usage["intermediate_bytes"]:
+            if not retire_session(session_id):
+                continue
+            removed, freed = remove_intermediates(session_dir)
+            result["removed_intermediates"] += removed
+            result["freed_bytes"] += freed
+
+        # Writers always replace files (see replace_atomically), so linking is safe
+        if is_session_busy(session_id):
+            continue
+
+        for path in session_dir.iterdir():
+            if not path.is_file() or ".tmp." in path.name:
+                continue
+            stat = path.stat()
+            key = (file_digest(path, stat), stat.st_size)
+            original = canonical.setdefault(key, path)
+            if original == path or os.path.samefile(original, path):
+                continue
+            try:
+                # Skip files replaced since they were hashed
+                current = path.stat()
+                if (current.st_ino, current.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+                    continue
+                linked = path.with_name(path.name + ".dedupe")
+                os.link(original, linked)
+                os.replace(linked, path)
+                result["deduplicated_files"] += 1
+                result["freed_bytes"] += stat.st_size
+            except OSError as e:
+                print(f"Could not deduplicate {path}: {e}")
+
+    # Forget digests of files that no longer exist
+    for key in [k for k in storage_digests if not Path(k[0]).exists()]:
+        del storage_digests[key]
+
+    result["duration_seconds"] = round(time.time() - started, 3)
+    result["finished_at"] = time.time()
+    last_storage_sweep.clear()
+    last_storage_sweep.update(result)
+    return result
+
+def storage_sweeper():
+    """Run the storage sweep periodically in the background"""
+    while True:
+        time.sleep(STORAGE_SWEEP_INTERVAL)
+        try:
+            result = sweep_storage()
+            print(f"Storage sweep: {result}")
+        except Exception as e:
+            print(f"Storage sweep failed: {e}")
 
 # API Endpoints
 
 @app.post("/upload-image/")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(request: Request, file: UploadFile = File(...)):
     """Upload and analyze image"""
+    check_client_rate(request)
     try:
         # Generate session ID
         session_id = str(uuid.uuid4())
@@ -335,12 +909,14 @@ async def upload_image(file: UploadFile = File(...)):
         
         # Save uploaded image
         image_content = await file.read()
-        image = Image.open(BytesIO(image_content))
+        image = load_module("PIL.Image").open(BytesIO(image_content))
         original_image_path = session_dir / "original_image.jpeg"
-        image.save(original_image_path)
+        with replace_atomically(original_image_path) as temp_path:
+            image.save(temp_path)
         
         # Analyze image
-        image_description = llm_call(
+        image_description = await run_in_threadpool(
+            llm_call,
             IMAGE_DESCRIPTION_SYSTEM_PROMPT,
             "Describe the image in detail",
             image=image
@@ -365,12 +941,14 @@ async def upload_image(file: UploadFile = File(...)):
 
 @app.post("/generate-story/")
 async def generate_story(
+    request: Request,
     session_id: str = Form(...),
     story_prompt: str = Form(...),
     style_prompt: str = Form(""),
     aspect_ratio: str = Form("16:9")
 ):
     """Generate story from image and prompt"""
+    check_client_rate(request)
     try:
         if session_id not in sessions:
             raise HTTPException(status_code=404, detail="Session not found")
@@ -380,19 +958,20 @@ async def generate_story(
         
         # Generate story
         full_story_prompt = f"A story about {image_description['image_description']} {story_prompt}"
-        story_output = llm_call(STORY_SYSTEM_PROMPT, full_story_prompt)
+        story_output = await run_in_threadpool(llm_call, STORY_SYSTEM_PROMPT, full_story_prompt)
         story_dict = json.loads(story_output)
         
         # Apply style if provided
         styled_image = session_data["image"]
         if style_prompt:
             final_style_prompt = f"Make the image look like {style_prompt}"
-            styled_image = edit_image(session_data["image"], final_style_prompt, aspect_ratio)
+            styled_image = await run_in_threadpool(edit_image, session_data["image"], final_style_prompt, aspect_ratio)
             
             # Save styled image
             session_dir = Path(session_data["original_image_path"]).parent
             styled_image_path = session_dir / "styled_image.jpeg"
-            styled_image.save(styled_image_path)
+            with replace_atomically(styled_image_path) as temp_path:
+                styled_image.save(temp_path)
             sessions[session_id]["styled_image_path"] = str(styled_image_path)
             sessions[session_id]["styled_image"] = styled_image
         
@@ -428,11 +1007,16 @@ async def update_story(
 
 @app.post("/generate-image/")
 async def generate_image_endpoint(
+    request: Request,
     prompt: str = Form(...),
     aspect_ratio: str = Form("16:9")
 ):
     """Generate image from text prompt"""
+    ticket = admit_generation(request)
     try:
+        # Generate image once a generation slot is free
+        generated_image = await run_in_threadpool(generation_gate.run, ticket, lambda: generate_image(prompt))
+        
         # Generate session ID
         session_id = str(uuid.uuid4())
         
@@ -440,12 +1024,10 @@ async def generate_image_endpoint(
         session_dir = OUTPUT_DIR / session_id
         session_dir.mkdir(exist_ok=True)
         
-        # Generate image
-        generated_image = generate_image(prompt)
-        
         # Save generated image
         image_path = session_dir / "original_image.jpeg"
-        generated_image.save(image_path)
+        with replace_atomically(image_path) as temp_path:
+            generated_image.save(temp_path)
         
         # Create fake image description for backend consistency
         image_description_dict = {
@@ -489,11 +1071,12 @@ async def upload_audio(
         audio_content = await audio.read()
         audio_path = session_dir / "recorded_voice.wav"
         
-        with open(audio_path, "wb") as f:
+        with replace_atomically(audio_path) as temp_path, open(temp_path, "wb") as f:
             f.write(audio_content)
         
-        # Store audio path in session
+        # Store audio path in session and drop any previously uploaded sample
         sessions[session_id]["recorded_audio_path"] = str(audio_path)
+        sessions[session_id].pop("voice_sample_url", None)
         
         return {
             "message": "Audio uploaded successfully",
@@ -519,7 +1102,7 @@ async def use_styled_as_base(session_id: str = Form(...)):
             raise HTTPException(status_code=404, detail="Styled image not found")
         
         # Load the styled image
-        styled_image = Image.open(styled_image_path)
+        styled_image = load_module("PIL.Image").open(styled_image_path)
         
         # Update session data to use styled image as the base
         sessions[session_id]["image"] = styled_image
@@ -544,10 +1127,17 @@ async def get_generation_status(session_id: str):
 
 @app.post("/generate-assets/")
 async def generate_assets(
+    request: Request,
     session_id: str = Form(...),
     audio_path: str = Form(None)
 ):
     """Generate images and audio for all scenes"""
+    ticket = admit_generation(request, session_id)
+    queue_position = generation_gate.position(ticket)
+
+    def report_queue_position(position: int):
+        set_generation_status(session_id, f"Queued (position {position})", queue_position=position)
+
     def generate_assets_background():
         try:
             print(f"Starting asset generation for session: {session_id}")
@@ -563,48 +1153,57 @@ async def generate_assets(
             aspect_ratio = session_data.get("aspect_ratio", "16:9")
             
             session_dir = Path(session_data["original_image_path"]).parent
-            recorded_audio_path = session_data.get("recorded_audio_path", None)
+
+            # Prepare and upload the recorded voice once for all scenes
+            try:
+                voice_sample_url = get_voice_sample_url(session_id)
+            except Exception as voice_err:
+                print(f"Voice sample preparation failed: {voice_err}. Using default voice.")
+                voice_sample_url = None
             
             # Generate assets for each scene
             scene_assets = []
             current_image = start_image
             
             print(f"Generating assets for {len(story['scenes'])} scenes")
+
+            # -----------------
+            # AUDIO GENERATION
+            # -----------------
+            # Chatterbox takes one prompt per call, so scene narrations run
+            # concurrently while images are chained sequentially below
+            audio_executor = ThreadPoolExecutor(max_workers=TTS_MAX_CONCURRENCY)
+            audio_futures = [
+                audio_executor.submit(
+                    generate_scene_audio,
+                    scene["text"],
+                    voice_sample_url,
+                    str(session_dir / f"scene_{i}_audio.wav")
+                )
+                for i, scene in enumerate(story["scenes"])
+            ]
+            audio_executor.shutdown(wait=False)
             
             for i, scene in enumerate(story["scenes"]):
                 try:
                     print(f"Processing scene {i+1}/{len(story['scenes'])}: {scene['heading']}")
 
-                    # -----------------
-                    # AUDIO GENERATION
-                    # -----------------
-                    audio_path = session_dir / f"scene_{i}_audio.wav"
-                    try:
-                        audio_url = generate_audio(scene["text"], recorded_audio_path)
-                        save_audio(audio_url, str(audio_path))
-                        print(f"Audio saved: {audio_path}")
-                    except Exception as audio_err:
-                        print(f"Audio generation failed for scene {i}: {audio_err}. Creating silent placeholder.")
-                        with wave.open(str(audio_path), 'w') as wf:
-                            wf.setnchannels(1)
-                            wf.setsampwidth(2)
-                            wf.setframerate(16000)
-                            silence = struct.pack('<h', 0)
-                            for _ in range(16000):
-                                wf.writeframes(silence)
-
                     # -----------------
                     # IMAGE GENERATION
                     # -----------------
                     image_path = session_dir / f"scene_{i}_image.jpeg"
                     try:
                         scene_image = edit_image(current_image, scene["image_prompt"], aspect_ratio)
-                        scene_image.save(image_path)
+                        with replace_atomically(image_path) as temp_path:
+                            scene_image.save(temp_path)
                         print(f"Image saved: {image_path}")
                         current_image = scene_image
                     except Exception as img_err:
                         print(f"Image generation failed for scene {i}: {img_err}. Using previous image as fallback.")
-                        current_image.save(image_path)
+                        with replace_atomically(image_path) as temp_path:
+                            current_image.save(temp_path)
+
+                    audio_path = audio_futures[i].result()
 
                     # Append asset info
                     scene_assets.append({
@@ -628,22 +1227,33 @@ async def generate_assets(
             print(f"Asset generation error for session {session_id}: {error_msg}")
             set_generation_status(session_id, "Failed", True, error_msg)
     
-    # Start generation in background
-    thread = threading.Thread(target=generate_assets_background)
+    # Start generation in background once a generation slot is free
+    if queue_position:
+        report_queue_position(queue_position)
+    thread = threading.Thread(
+        target=generation_gate.run,
+        args=(ticket, generate_assets_background, report_queue_position)
+    )
     thread.daemon = True
     thread.start()
     
     # Return immediately
-    return {"message": "Asset generation started. This may take a minute or two...", "session_id": session_id}
+    return {
+        "message": "Asset generation started. This may take a minute or two...",
+        "session_id": session_id,
+        "queue_position": queue_position
+    }
 
 @app.post("/generate-movie/")
-async def generate_movie(request: MovieGenerationRequest):
+async def generate_movie(request: MovieGenerationRequest, http_request: Request):
     """Generate final movie"""
-    try:
+    def render_movie() -> str:
         if request.session_id not in sessions:
             raise HTTPException(status_code=404, detail="Session not found")
         
         session_data = sessions[request.session_id]
+        if "scene_assets" not in session_data:
+            raise HTTPException(status_code=404, detail="Scene assets not found, generate assets first")
         scene_assets = session_data["scene_assets"]
         session_dir = Path(session_data["original_image_path"]).parent
         
@@ -677,8 +1287,16 @@ async def generate_movie(request: MovieGenerationRequest):
                 str(session_dir)
             )
         
+        return final_movie_path
+
+    ticket = admit_generation(http_request, request.session_id)
+    try:
+        final_movie_path = await run_in_threadpool(generation_gate.run, ticket, render_movie)
+        
         return {"movie_path": final_movie_path}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Movie generation failed: {str(e)}")
 
@@ -686,13 +1304,16 @@ async def generate_movie(request: MovieGenerationRequest):
 async def download_file(session_id: str, filename: str):
     """Download generated files"""
     try:
-        if session_id not in sessions:
+        if session_id in sessions:
+            session_dir = Path(sessions[session_id]["original_image_path"]).parent
+        elif filename in FINAL_MOVIE_FILES:
+            # Sessions retired by the storage sweeper keep only their final movies
+            session_dir = OUTPUT_DIR / session_id
+        else:
             raise HTTPException(status_code=404, detail="Session not found")
-        
-        session_dir = Path(sessions[session_id]["original_image_path"]).parent
         file_path = session_dir / filename
         
-        if not file_path.exists():
+        if OUTPUT_DIR.resolve() not in file_path.resolve().parents or not file_path.is_file():
             raise HTTPException(status_code=404, detail="File not found")
         
         return FileResponse(
@@ -701,25 +1322,37 @@ async def download_file(session_id: str, filename: str):
             media_type='application/octet-stream'
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
+def scene_audio_clips(audio_paths: List[str]) -> list:
+    """Open each scene's narration as an audio clip"""
+    editor = load_module("moviepy.editor")
+    return [editor.AudioFileClip(audio_path) for audio_path in audio_paths]
+
+def attach_scene_audio(clip, audio_clip):
+    """Fit a scene's visual clip to its narration and attach the audio"""
+    if clip.duration is not None and audio_clip.duration < clip.duration:
+        clip = clip.subclip(0, audio_clip.duration)
+    else:
+        clip = clip.set_duration(audio_clip.duration)
+    return clip.set_audio(audio_clip)
+
 def stitch_image_movie(image_paths: List[str], audio_paths: List[str], output_dir: str) -> str:
     """Create movie from images and audio"""
     try:
-        clips = []
-        
-        for image_path, audio_path in zip(image_paths, audio_paths):
-            audio_clip = AudioFileClip(audio_path)
-            duration = audio_clip.duration
-            
-            image_clip = ImageClip(image_path).set_duration(duration)
-            video_clip = image_clip.set_audio(audio_clip)
-            clips.append(video_clip)
+        editor = load_module("moviepy.editor")
+        clips = [
+            attach_scene_audio(editor.ImageClip(image_path), audio_clip)
+            for image_path, audio_clip in zip(image_paths, scene_audio_clips(audio_paths))
+        ]
         
-        final_movie = concatenate_videoclips(clips, method="compose")
+        final_movie = editor.concatenate_videoclips(clips, method="compose")
         output_path = os.path.join(output_dir, "final_slideshow_movie.mp4")
-        final_movie.write_videofile(output_path, fps=24)
+        with replace_atomically(output_path) as temp_path:
+            final_movie.write_videofile(temp_path, fps=24)
         
         # Cleanup
         for clip in clips:
@@ -734,24 +1367,16 @@ def stitch_image_movie(image_paths: List[str], audio_paths: List[str], output_di
 def stitch_video_movie(video_paths: List[str], audio_paths: List[str], output_dir: str) -> str:
     """Create movie from videos and audio"""
     try:
-        clips = []
-        
-        for video_path, audio_path in zip(video_paths, audio_paths):
-            video_clip = VideoFileClip(video_path)
-            audio_clip = AudioFileClip(audio_path)
-            
-            # Adjust video duration to match audio
-            if audio_clip.duration < video_clip.duration:
-                video_clip = video_clip.subclip(0, audio_clip.duration)
-            else:
-                video_clip = video_clip.set_duration(audio_clip.duration)
-            
-            final_clip = video_clip.set_audio(audio_clip)
-            clips.append(final_clip)
+        editor = load_module("moviepy.editor")
+        clips = [
+            attach_scene_audio(editor.VideoFileClip(video_path), audio_clip)
+            for video_path, audio_clip in zip(video_paths, scene_audio_clips(audio_paths))
+        ]
         
-        final_movie = concatenate_videoclips(clips, method="compose")
+        final_movie = editor.concatenate_videoclips(clips, method="compose")
         output_path = os.path.join(output_dir, "final_video_movie.mp4")
-        final_movie.write_videofile(output_path, fps=24)
+        with replace_atomically(output_path) as temp_path:
+            final_movie.write_videofile(temp_path, fps=24)
         
         # Cleanup
         for clip in clips:
@@ -763,13 +1388,87 @@ def stitch_video_movie(video_paths: List[str], audio_paths: List[str], output_di
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Video movie stitching failed: {str(e)}")
 
+@app.on_event("startup")
+async def report_startup():
+    """Optionally warm heavy modules and record how long startup took"""
+    if PRELOAD_MODULES:
+        for name in HEAVY_MODULES:
+            load_module(name)
+        startup_report["preloaded"] = True
+
+    startup_report["ready_seconds"] = time.perf_counter() - PROCESS_STARTED
+    print(
+        f"Startup: imports {startup_report['import_seconds']:.2f}s, "
+        f"ready in {startup_report['ready_seconds']:.2f}s "
+        f"({'preloaded' if PRELOAD_MODULES else 'lazy'} media modules)"
+    )
+
+@app.on_event("startup")
+async def start_storage_sweeper():
+    """Start the background storage sweeper"""
+    if STORAGE_SWEEP_INTERVAL > 0:
+        thread = threading.Thread(target=storage_sweeper)
+        thread.daemon = True
+        thread.start()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/admission-status")
+async def get_admission_status():
+    """Report active and queued generations"""
+    return generation_gate.stats()
+
+def storage_report() -> dict:
+    """Disk usage per session, retention settings and the last sweep result"""
+    seen_inodes = set()
+    # Session IDs grant access to their files, so only opaque hashes are reported
+    session_usage = {
+        hashlib.sha256(session_dir.name.encode()).hexdigest()[:16]: session_disk_usage(session_dir, seen_inodes)
+        for session_dir in sorted(p for p in OUTPUT_DIR.iterdir() if p.is_dir())
+    }
+    return {
+        "total_bytes": sum(usage["bytes"] for usage in session_usage.values()),
+        "final_bytes": sum(usage["final_bytes"] for usage in session_usage.values()),
+        "intermediate_bytes": sum(usage["intermediate_bytes"] for usage in session_usage.values()),
+        "session_count": len(session_usage),
+        "sessions": session_usage,
+        "retention": {
+            "retention_days": STORAGE_RETENTION_DAYS,
+            "intermediate_grace_hours": STORAGE_INTERMEDIATE_GRACE_HOURS,
+            "delete_intermediates": STORAGE_DELETE_INTERMEDIATES,
+            "sweep_interval_seconds": STORAGE_SWEEP_INTERVAL,
+        },
+        "last_sweep": last_storage_sweep or None,
+    }
+
+@app.get("/storage-report")
+async def get_storage_report():
+    """Report disk usage per session and the last storage sweep"""
+    return await run_in_threadpool(storage_report)
+
+@app.get("/startup-report")
+async def get_startup_report():
+    """Report startup timings and which heavy modules are loaded"""
+    return {
+        **startup_report,
+        "module_load_seconds": module_load_times,
+        "loaded_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+
 
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Movie Generator API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--preload", action="store_true", help="Import media and provider modules at startup")
+    args = parser.parse_args()
+
+    PRELOAD_MODULES = PRELOAD_MODULES or args.preload
+    uvicorn.run(app, host=args.host, port=args.port)
\ No newline at end of file
@@ -630,6 +630,9 @@ async function handleGenerateAssets() {
         const data = await response.json();
         console.log('Asset generation started:', data);
         addLogEntry(data.message, 'success');
+        if (data.queue_position) {
+            addLogEntry(`Waiting in queue at position ${data.queue_position}`, 'info');
+        }
         
         // Start checking for completion
         checkGenerationStatus(sessionId);
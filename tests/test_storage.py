@@ -0,0 +1,117 @@
+import asyncio
+import os
+import time
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, Request, UploadFile
+
+os.environ.setdefault("REPLICATE_API_KEY", "test")
+
+import main
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(main, "sessions", {})
+    monkeypatch.setattr(main, "generation_status", {})
+    monkeypatch.setattr(main, "storage_digests", {})
+    monkeypatch.setattr(main, "STORAGE_DELETE_INTERMEDIATES", True)
+    return tmp_path
+
+
+def make_session(output_dir, session_id, files, live=False, age_hours=2):
+    """Create a session directory whose files were last written age_hours ago"""
+    session_dir = output_dir / session_id
+    session_dir.mkdir()
+    for name, content in files.items():
+        (session_dir / name).write_bytes(content)
+    written = time.time() - age_hours * 60 * 60
+    for path in [*session_dir.iterdir(), session_dir]:
+        os.utime(path, (written, written))
+    if live:
+        main.sessions[session_id] = {
+            "original_image_path": str(session_dir / "original_image.jpeg"),
+            "scene_assets": [],
+        }
+    return session_dir
+
+
+def test_write_to_deduplicated_session_leaves_other_session_intact(output_dir):
+    voice = b"identical voice"
+    session_a = make_session(output_dir, "a", {"recorded_voice.wav": voice}, live=True)
+    session_c = make_session(output_dir, "c", {"recorded_voice.wav": voice}, live=True)
+
+    result = main.sweep_storage()
+    assert result["deduplicated_files"] == 1
+    assert os.path.samefile(session_a / "recorded_voice.wav", session_c / "recorded_voice.wav")
+
+    upload = UploadFile(file=BytesIO(b"new session c audio"), filename="recorded_voice.wav")
+    asyncio.run(main.upload_audio(audio=upload, session_id="c"))
+
+    assert (session_c / "recorded_voice.wav").read_bytes() == b"new session c audio"
+    assert (session_a / "recorded_voice.wav").read_bytes() == voice
+
+
+def test_finished_sessions_are_retired_and_deduplicated(output_dir):
+    files = {
+        "original_image.jpeg": b"image",
+        "scene_0_audio.wav": b"audio",
+        "final_slideshow_movie.mp4": b"movie",
+    }
+    session_a = make_session(output_dir, "a", files, live=True)
+    session_b = make_session(output_dir, "b", files, live=True)
+
+    result = main.sweep_storage()
+
+    assert result["removed_intermediates"] == 4
+    assert result["deduplicated_files"] == 1
+    assert sorted(p.name for p in session_a.iterdir()) == ["final_slideshow_movie.mp4"]
+    assert os.path.samefile(session_a / "final_slideshow_movie.mp4", session_b / "final_slideshow_movie.mp4")
+    assert main.sessions == {}
+
+
+def test_session_with_generation_ticket_is_not_cleaned(output_dir):
+    files = {"scene_0_image.jpeg": b"image", "final_video_movie.mp4": b"movie"}
+    session_dir = make_session(output_dir, "busy", files, live=True)
+    ticket = main.generation_gate.admit(owner="busy")
+    try:
+        result = main.sweep_storage()
+    finally:
+        main.generation_gate.release(ticket)
+
+    assert result["removed_intermediates"] == 0
+    assert (session_dir / "scene_0_image.jpeg").exists()
+    assert "busy" in main.sessions
+
+
+def test_retired_session_serves_final_movie_and_rejects_rendering(output_dir):
+    files = {"scene_0_image.jpeg": b"image", "final_slideshow_movie.mp4": b"movie"}
+    session_dir = make_session(output_dir, "done", files, live=True)
+    main.sweep_storage()
+
+    response = asyncio.run(main.download_file("done", "final_slideshow_movie.mp4"))
+    assert response.path == str(session_dir / "final_slideshow_movie.mp4")
+
+    request = Request({"type": "http", "headers": [], "client": ("127.0.0.1", 0)})
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.generate_movie(main.MovieGenerationRequest(session_id="done"), request))
+    assert error.value.status_code == 404
+
+    for session_id, filename in [("done", "scene_0_image.jpeg"), ("..", "main.py")]:
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(main.download_file(session_id, filename))
+        assert error.value.status_code == 404
+
+
+def test_retired_session_only_serves_final_movies(output_dir):
+    make_session(output_dir, "private", {"original_image.jpeg": b"photo"}, age_hours=0)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.download_file("private", "original_image.jpeg"))
+    assert error.value.status_code == 404
+
+    report = main.storage_report()
+    assert report["session_count"] == 1
+    assert "private" not in report["sessions"]